@@ -0,0 +1,187 @@
+"""Knowledge agent chain: plans lookups, runs them in parallel and answers.
+
+Kept free of Streamlit so it can be reused by app.py and run in batch mode:
+
+    python agent.py --batch prompts.jsonl > results.jsonl
+
+LangChain is only imported when tools or the chain are first built, so
+importing this module stays cheap.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables before reading feature flags
+load_dotenv()
+
+# Web search is opt-in since it relies on public SearxNG hosts
+ENABLE_WEB_SEARCH = os.getenv("ENABLE_SEARX", "0") == "1"
+
+# Fast model used to plan lookups when speed mode is on
+PLANNER_MODEL = "llama-3.1-8b-instant"
+
+# Tools queried with the raw prompt while the planner runs, and how long
+# to wait for them
+PREFETCH_TOOLS = ["wikipedia", "arxiv"]
+PREFETCH_TIMEOUT = 3
+
+# Tag on the answering model so only its tokens are streamed to the chat
+FINAL_ANSWER_TAG = "final_answer"
+
+PLANNER_SYSTEM_PROMPT = """You plan lookups for a knowledge assistant. Available tools:
+
+{tools}
+
+List every lookup needed to answer the user's question. Lookups run in parallel, so they must not depend on each other's results. Use a short search query for each.
+
+If the question is about well-established facts you can answer reliably without looking anything up, return no lookups."""
+
+ANSWER_SYSTEM_PROMPT = """Answer the user's question as best you can. Ground your answer in the context below when it is relevant, and say so when it does not cover the question.
+
+Context:
+{context}"""
+
+DIRECT_SYSTEM_PROMPT = """Answer the user's question accurately and concisely from your own knowledge."""
+
+def build_tools():
+    """Create the Arxiv and Wikipedia tools, plus web search when enabled"""
+    from tools import create_tools
+    return create_tools(ENABLE_WEB_SEARCH)
+
+def build_chain(api_key, model_choice, speed_mode=False, tools=None):
+    """Create the plan, parallel lookup and answer chain"""
+    from langchain_groq import ChatGroq
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+    from langchain_core.runnables.config import ContextThreadPoolExecutor
+    from langchain_core.tools import render_text_description
+    from tools import (
+        ToolPlan, ToolQuery, arun_lookups, format_observations, has_content,
+        is_failed_observation, lookup_key, planned_queries, run_lookups
+    )
+    
+    llm = ChatGroq(
+        groq_api_key=api_key, 
+        model_name=model_choice,
+        streaming=True,
+        temperature=0.1
+    )
+    
+    # Speed mode plans lookups on the small model and keeps the selected
+    # model for the answer
+    planner_llm = ChatGroq(
+        groq_api_key=api_key,
+        model_name=PLANNER_MODEL if speed_mode else model_choice,
+        temperature=0
+    )
+    
+    tools = tools or build_tools()
+    tool_map = {tool.name: tool for tool in tools}
+    
+    # One structured call plans all lookups. A failed plan, either an error
+    # or no tool call at all, comes back as None rather than an empty plan
+    planner = (
+        ChatPromptTemplate.from_messages([("system", PLANNER_SYSTEM_PROMPT), ("human", "{input}")])
+        .partial(tools=render_text_description(tools))
+        | planner_llm.with_structured_output(ToolPlan)
+    ).with_fallbacks([RunnableLambda(lambda _: None)])
+    
+    # Only an explicit empty plan answers directly; a failed plan still goes
+    # through the lookup branch and answers from the prefetched results
+    def needs_lookups(inputs):
+        return inputs["plan"] is None or bool(planned_queries(tool_map, inputs["plan"]))
+    
+    # Speculative lookups on the raw prompt start before the planner call and
+    # run in the background; only the lookup branch waits for them
+    def prefetch_queries(inputs):
+        return [ToolQuery(tool=name, query=inputs["input"]) for name in PREFETCH_TOOLS if name in tool_map]
+    
+    def start_prefetch(inputs, config):
+        executor = ContextThreadPoolExecutor(max_workers=1)
+        future = executor.submit(run_lookups, tool_map, prefetch_queries(inputs), config, PREFETCH_TIMEOUT)
+        executor.shutdown(wait=False)
+        return future
+    
+    async def astart_prefetch(inputs, config):
+        return asyncio.ensure_future(
+            arun_lookups(tool_map, prefetch_queries(inputs), config, PREFETCH_TIMEOUT)
+        )
+    
+    # A prefetch only stands in for a planned lookup asking the same thing;
+    # the planner's own queries still run
+    def split_lookups(inputs, prefetched):
+        answered = {lookup_key(q) for q, r in prefetched if not is_failed_observation(r)}
+        remaining = [
+            q for q in planned_queries(tool_map, inputs["plan"])
+            if lookup_key(q) not in answered
+        ]
+        return [(q, r) for q, r in prefetched if has_content(r)], remaining
+    
+    def gather_context(inputs, config):
+        prefetched, remaining = split_lookups(inputs, inputs["prefetch"].result())
+        return format_observations(prefetched + run_lookups(tool_map, remaining, config))
+    
+    async def agather_context(inputs, config):
+        prefetched, remaining = split_lookups(inputs, await inputs["prefetch"])
+        return format_observations(prefetched + await arun_lookups(tool_map, remaining, config))
+    
+    answer_llm = llm.with_config(tags=[FINAL_ANSWER_TAG])
+    answer_prompt = ChatPromptTemplate.from_messages([("system", ANSWER_SYSTEM_PROMPT), ("human", "{input}")])
+    direct_prompt = ChatPromptTemplate.from_messages([("system", DIRECT_SYSTEM_PROMPT), ("human", "{input}")])
+    
+    lookup_and_answer = (
+        RunnablePassthrough.assign(context=RunnableLambda(gather_context, afunc=agather_context))
+        | RunnablePassthrough.assign(output=answer_prompt | answer_llm | StrOutputParser())
+    )
+    # An empty plan skips the lookups and answers straight from the model
+    direct_answer = RunnablePassthrough.assign(output=direct_prompt | answer_llm | StrOutputParser())
+    
+    return (
+        RunnablePassthrough.assign(prefetch=RunnableLambda(start_prefetch, afunc=astart_prefetch))
+        | RunnablePassthrough.assign(plan=planner)
+        | RunnableBranch((needs_lookups, lookup_and_answer), direct_answer)
+    ).with_config(run_name="KnowledgeChain")
+
+def run_batch(chain, prompts, max_concurrency=8):
+    """Answer many prompts with one shared chain, running up to max_concurrency at once"""
+    responses = chain.batch(
+        [{"input": prompt} for prompt in prompts],
+        config={"max_concurrency": max_concurrency, "callbacks": []},
+        return_exceptions=True
+    )
+    results = []
+    for prompt, response in zip(prompts, responses):
+        if isinstance(response, Exception):
+            results.append({"prompt": prompt, "error": str(response)})
+        else:
+            results.append({"prompt": prompt, "output": response["output"]})
+    return results
+
+def main(argv=None):
+    """Read JSONL prompts and write one JSONL result per prompt to stdout"""
+    parser = argparse.ArgumentParser(description="Answer prompts in batch without Streamlit")
+    parser.add_argument("--batch", required=True, metavar="PATH",
+                        help='JSONL file of {"prompt": ...} objects, or - for stdin')
+    parser.add_argument("--model", default="llama-3.3-70b-versatile", help="Groq model for answers")
+    parser.add_argument("--speed-mode", action="store_true", help=f"Plan lookups with {PLANNER_MODEL}")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        parser.error("GROQ_API_KEY must be set")
+
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    with source:
+        prompts = [json.loads(line)["prompt"] for line in source if line.strip()]
+
+    chain = build_chain(api_key, args.model, args.speed_mode)
+    for result in run_batch(chain, prompts, args.max_concurrency):
+        print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
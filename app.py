@@ -1,11 +1,9 @@
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain_community.utilities import ArxivAPIWrapper, WikipediaAPIWrapper
-from langchain_community.tools import ArxivQueryRun, WikipediaQueryRun
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain import hub
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
+from agent import ENABLE_WEB_SEARCH, FINAL_ANSWER_TAG, PLANNER_MODEL, build_chain, build_tools
+import asyncio
+import hashlib
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -17,53 +15,57 @@ st.set_page_config(
     layout="wide"
 )
 
-# Clear any cached resources to avoid old model references
-if st.sidebar.button("🔄 Clear Cache"):
-    st.cache_resource.clear()
-    st.rerun()
+# Chat history kept in session state, including the opening greeting
+MAX_HISTORY_MESSAGES = 20
 
-@st.cache_resource
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
 def initialize_tools():
     """Initialize and cache tools for better performance"""
-    # Arxiv tool
-    arxiv_wrapper = ArxivAPIWrapper(top_k_results=1, doc_content_chars_max=200)
-    arxiv = ArxivQueryRun(api_wrapper=arxiv_wrapper)
-    
-    # Wikipedia tool
-    api_wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=200)
-    wiki = WikipediaQueryRun(api_wrapper=api_wrapper)
-    
-    return [arxiv, wiki]
-
-def create_agent(api_key, model_choice):
-    """Create and return the agent executor"""
+    return build_tools()
+
+def hash_api_key(api_key):
+    """Digest used as the cache key so the raw key never lands in the cache index"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+# Leading underscore keeps the raw key out of Streamlit's cache key
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
+def create_agent(_api_key, api_key_hash, model_choice, speed_mode=False):
+    """Create the plan, parallel lookup and answer chain, reused across turns"""
+    return build_chain(_api_key, model_choice, speed_mode, initialize_tools())
+
+# No TTL: the cached chains' async Groq clients keep connections bound to
+# this loop, so every turn must run on it rather than a fresh asyncio.run
+@st.cache_resource(show_spinner=False)
+def background_loop():
+    """Long-lived event loop, shared by all turns, running in a daemon thread"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+async def _next_event(events):
+    return await events.__anext__()
+
+async def _close_events(events):
+    await events.aclose()
+
+def stream_events(chain, inputs):
+    """Run chain.astream_events on the background loop, yielding each event to the script thread"""
+    loop = background_loop()
+    events = chain.astream_events(inputs, version="v2")
     try:
-        llm = ChatGroq(
-            groq_api_key=api_key, 
-            model_name=model_choice,
-            streaming=True,
-            temperature=0.1
-        )
-        
-        tools = initialize_tools()
-        
-        # Get the React prompt from hub
-        react_prompt = hub.pull("hwchase17/react")
-        
-        # Create agent using modern approach
-        agent = create_react_agent(llm, tools, react_prompt)
-        agent_executor = AgentExecutor(
-            agent=agent, 
-            tools=tools, 
-            verbose=True, 
-            handle_parsing_errors=True,
-            max_iterations=5
-        )
-        
-        return agent_executor
-    except Exception as e:
-        st.error(f"Error creating agent: {str(e)}")
-        return None
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(_next_event(events), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Stop the run if the script is interrupted mid-stream
+        asyncio.run_coroutine_threadsafe(_close_events(events), loop)
+
+# Clear cached agents to avoid old model references; the tools stay cached
+if st.sidebar.button("🔄 Clear Cache"):
+    create_agent.clear()
+    st.rerun()
 
 # Main app
 st.title("📚 LangChain - Knowledge Assistant")
@@ -95,6 +97,12 @@ selected_model = st.sidebar.selectbox(
 
 model_name = model_options[selected_model]
 
+speed_mode = st.sidebar.toggle(
+    "⚡ Speed mode",
+    value=True,
+    help=f"Plan lookups with {PLANNER_MODEL} and use the selected model only for the final answer"
+)
+
 if st.sidebar.button("Clear Chat History"):
     st.session_state.messages = [
         {"role": "assistant", "content": "Hi, I'm a knowledge assistant who can search Wikipedia and Arxiv. How can I help you?"}
@@ -106,6 +114,8 @@ st.sidebar.markdown("""
 - 📚 **Wikipedia**: General encyclopedia articles  
 - 📖 **Arxiv**: Academic papers and research
 """)
+if ENABLE_WEB_SEARCH:
+    st.sidebar.markdown("- 🔍 **Web search**: Current events via SearxNG")
 
 st.sidebar.markdown("### Perfect for")
 st.sidebar.markdown("""
@@ -118,6 +128,8 @@ st.sidebar.markdown("""
 
 st.sidebar.markdown(f"### Current Model")
 st.sidebar.info(f"Using: {model_name}")
+if speed_mode:
+    st.sidebar.caption(f"Planning with: {PLANNER_MODEL}")
 
 # Initialize chat history
 if "messages" not in st.session_state:
@@ -130,63 +142,88 @@ for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.write(msg["content"])
 
-# Chat input
-if prompt := st.chat_input(placeholder="Ask me about any topic..."):
+def add_message(role, content):
+    """Append to the chat history, keeping the greeting and the latest turns"""
+    messages = st.session_state.messages
+    messages.append({"role": role, "content": content})
+    if len(messages) > MAX_HISTORY_MESSAGES:
+        st.session_state.messages = messages[:1] + messages[-(MAX_HISTORY_MESSAGES - 1):]
+
+def handle(prompt):
+    """Run the chain for a single prompt, streaming its events into the chat"""
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     
     # Display user message
     with st.chat_message("user"):
         st.write(prompt)
     
-    # Process with agent
+    # Process with chain
     if not api_key:
         with st.chat_message("assistant"):
             st.warning("Please enter your Groq API key in the sidebar to continue.")
-    else:
-        with st.chat_message("assistant"):
-            try:
-                # Create agent with selected model
-                agent_executor = create_agent(api_key, model_name)
-                
-                if agent_executor:
-                    # Create callback handler
-                    st_cb = StreamlitCallbackHandler(
-                        st.container(), 
-                        expand_new_thoughts=False,
-                        collapse_completed_thoughts=True
-                    )
-                    
-                    # Execute agent with spinner
-                    with st.spinner("Searching knowledge bases..."):
-                        response = agent_executor.invoke(
-                            {"input": prompt},
-                            {"callbacks": [st_cb]}
-                        )
-                    
-                    # Extract and display response
-                    if "output" in response:
-                        answer = response["output"]
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": answer
-                        })
-                        st.write(answer)
-                    else:
-                        st.error("No output received from agent")
-                        
-            except Exception as e:
-                error_msg = f"An error occurred: {str(e)}"
-                st.error(error_msg)
-                
-                # Suggest trying a different model if the current one fails
-                if "decommissioned" in str(e).lower() or "deprecated" in str(e).lower():
-                    st.warning("The selected model may be deprecated. Try selecting a different model from the sidebar.")
+        return
+    
+    with st.chat_message("assistant"):
+        status = None
+        try:
+            # Reuse the cached chain for this key and model
+            chain = create_agent(api_key, hash_api_key(api_key), model_name, speed_mode)
+            
+            # Lookup progress is rendered from the event stream into one
+            # status element instead of a callback handler's thought tree
+            status = st.status("Searching knowledge bases...", expanded=False)
+            
+            # Stream the final answer into a placeholder below the status
+            placeholder = st.empty()
+            streamed = []
+            response = None
+            
+            # Execute chain; planned lookups run concurrently
+            for event in stream_events(chain, {"input": prompt}):
+                if event["event"] == "on_chat_model_stream":
+                    # The planner streams tool calls; only the answer is shown
+                    if FINAL_ANSWER_TAG in event["tags"]:
+                        streamed.append(event["data"]["chunk"].content)
+                        placeholder.markdown("".join(streamed))
+                elif event["event"] == "on_tool_start":
+                    status.write(f"🔎 **{event['name']}**: {event['data'].get('input')}")
+                elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+                    response = event["data"]["output"]
+            
+            # Only the lookup branch adds context; the direct answer ignores
+            # any speculative lookups
+            if not response or "context" not in response:
+                label = "Answered from model knowledge"
+            elif response.get("plan") is None:
+                label = "Planning failed, answered from the initial search"
+            else:
+                label = "Search complete"
+            status.update(label=label, state="complete")
+            
+            # Extract and display response
+            if response and "output" in response:
+                answer = response["output"]
+                add_message("assistant", answer)
+                placeholder.markdown(answer)
+            else:
+                st.error("No output received from chain")
                 
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": error_msg
-                })
+        except Exception as e:
+            if status is not None:
+                status.update(label="Search failed", state="error")
+            error_msg = f"An error occurred: {str(e)}"
+            st.error(error_msg)
+            
+            # Suggest trying a different model if the current one fails
+            if "decommissioned" in str(e).lower() or "deprecated" in str(e).lower():
+                st.warning("The selected model may be deprecated. Try selecting a different model from the sidebar.")
+            
+            add_message("assistant", error_msg)
+
+# Chat input
+if prompt := st.chat_input(placeholder="Ask me about any topic..."):
+    handle(prompt)
 
 # Footer
 st.sidebar.markdown("---")
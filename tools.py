@@ -0,0 +1,253 @@
+"""Knowledge source tools and the parallel runner for planned lookups."""
+from langchain_community.utilities import ArxivAPIWrapper, WikipediaAPIWrapper, SearxSearchWrapper
+from langchain_community.utilities import searx_search
+from langchain_community.tools import ArxivQueryRun, WikipediaQueryRun
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from langchain_core.tools import BaseTool, Tool
+from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List
+import arxiv
+import diskcache
+import wikipedia
+import requests
+import asyncio
+import json
+import orjson
+import types
+
+# On-disk cache of tool results shared across sessions and restarts
+TOOL_CACHE = diskcache.Cache("./.tool_cache", size_limit=200 * 1024 * 1024)
+TOOL_CACHE_TTL = 24 * 60 * 60
+CACHE_MISS = object()
+
+# Seconds a single lookup may take before it is reported as timed out
+TOOL_TIMEOUT = 5
+TIMEOUT_OBSERVATION = "[timeout]"
+ERROR_PREFIX = "Error: "
+
+# ArxivAPIWrapper reports HTTP and API errors as a result string with this prefix
+ARXIV_ERROR_PREFIX = "Arxiv exception"
+FAILURE_PREFIXES = (ERROR_PREFIX, ARXIV_ERROR_PREFIX)
+
+# Both wrappers answer "No good ... Result was found" when a search comes up empty
+EMPTY_RESULT_PREFIX = "No good "
+
+# Public SearxNG instances raced against each other for every web search
+SEARX_HOSTS = [
+    "https://searx.be",
+    "https://search.brave4u.com",
+    "https://searx.tiekoetter.com",
+]
+
+class ToolQuery(BaseModel):
+    """A single lookup against one knowledge source"""
+    tool: str = Field(description="Name of the tool to query")
+    query: str = Field(description="Search query to send to the tool")
+
+class ToolPlan(BaseModel):
+    """Independent lookups needed to answer the question"""
+    queries: List[ToolQuery] = Field(default_factory=list, description="Lookups to run in parallel")
+
+def is_failed_observation(result):
+    """Whether a lookup result reports a timeout or error rather than content"""
+    return result == TIMEOUT_OBSERVATION or result.startswith(FAILURE_PREFIXES)
+
+def has_content(result):
+    """Whether a lookup result is worth passing to the answer as context"""
+    return not is_failed_observation(result) and not result.startswith(EMPTY_RESULT_PREFIX)
+
+def lookup_key(q):
+    """Normalized (tool, query) pair, matching how CachedTool keys its entries"""
+    return (q.tool, q.query.strip().lower())
+
+class CachedTool(BaseTool):
+    """Serve repeated queries for the wrapped tool from the disk cache"""
+    tool: BaseTool
+
+    def _cache_key(self, query):
+        return (self.name, query.strip().lower())
+
+    def _store(self, key, result):
+        # Errors returned as strings are transient, so they must not stick for a day
+        if not is_failed_observation(result):
+            TOOL_CACHE.set(key, result, expire=TOOL_CACHE_TTL)
+
+    def _run(self, query: str) -> str:
+        key = self._cache_key(query)
+        # Single read so an entry expiring between check and fetch can't raise
+        result = TOOL_CACHE.get(key, default=CACHE_MISS)
+        if result is not CACHE_MISS:
+            return result
+        result = self.tool.run(query)
+        self._store(key, result)
+        return result
+
+    async def _arun(self, query: str) -> str:
+        key = self._cache_key(query)
+        # Single read so an entry expiring between check and fetch can't raise
+        result = TOOL_CACHE.get(key, default=CACHE_MISS)
+        if result is not CACHE_MISS:
+            return result
+        result = await self.tool.arun(query)
+        self._store(key, result)
+        return result
+
+def cached(tool):
+    """Wrap a tool in CachedTool under its own name and description"""
+    return CachedTool(name=tool.name, description=tool.description, tool=tool)
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies TOOL_TIMEOUT to requests made without a timeout"""
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = TOOL_TIMEOUT
+        return super().send(request, **kwargs)
+
+def create_http_session():
+    """Keep-alive session so repeat lookups skip the TCP/TLS handshake"""
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        # One quick retry that ignores Retry-After, so a lookup abandoned at
+        # TOOL_TIMEOUT doesn't keep its thread busy for long
+        max_retries=Retry(total=1, backoff_factor=0.1, respect_retry_after_header=False)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def pooled_arxiv_search(session):
+    """Build an arxiv.Search class whose results are fetched over the shared session"""
+    class PooledSearch(arxiv.Search):
+        def results(self, offset=0):
+            # A fresh client per search keeps arxiv's per-client rate limit
+            # scoped to one query, as with the default Search.results();
+            # arxiv's own retries wait 3s each, well past TOOL_TIMEOUT
+            client = arxiv.Client(num_retries=0)
+            client._session = session
+            return client.results(self, offset=offset)
+
+    return PooledSearch
+
+def hedged_search(wrappers, query):
+    """Send the query to every Searx host and return the first successful response.
+
+    Raises when every host fails or none answers within TOOL_TIMEOUT, so the
+    failure is reported for this lookup but never cached.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(wrappers))
+    futures = [executor.submit(wrapper.run, query) for wrapper in wrappers]
+    error = None
+    try:
+        for future in as_completed(futures, timeout=TOOL_TIMEOUT):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+    except FuturesTimeoutError:
+        raise TimeoutError(f"No Searx host answered within {TOOL_TIMEOUT}s") from None
+    finally:
+        # Losing hosts finish in the background instead of holding up the answer
+        executor.shutdown(wait=False)
+    raise RuntimeError(f"All Searx hosts failed: {str(error)}") from error
+
+def use_orjson(module):
+    """Point a module's json global at a copy of json that decodes with orjson"""
+    fast_json = types.ModuleType("json")
+    fast_json.__dict__.update(vars(json))
+    fast_json.loads = orjson.loads
+    module.json = fast_json
+
+def create_tools(web_search=False):
+    """Create the Arxiv and Wikipedia tools, plus web search when enabled"""
+    session = create_http_session()
+    
+    # Arxiv tool
+    arxiv_wrapper = ArxivAPIWrapper(top_k_results=1, doc_content_chars_max=200)
+    arxiv_wrapper.arxiv_search = pooled_arxiv_search(session)
+    arxiv_tool = cached(ArxivQueryRun(api_wrapper=arxiv_wrapper))
+    
+    # Wikipedia tool; the wikipedia package calls requests.get at module
+    # level, and Session.get takes the same arguments
+    wikipedia.wikipedia.requests = session
+    api_wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=200)
+    wiki = cached(WikipediaQueryRun(api_wrapper=api_wrapper))
+    
+    if not web_search:
+        return [arxiv_tool, wiki]
+    
+    # Web search tool racing several Searx hosts over the same session;
+    # SearxResults parses each response body with the module's json.loads
+    searx_search.requests = session
+    use_orjson(searx_search)
+    searx_wrappers = [SearxSearchWrapper(searx_host=host, k=3) for host in SEARX_HOSTS]
+    search = cached(Tool(
+        name="search",
+        func=lambda query: hedged_search(searx_wrappers, query),
+        description="Search the web for current events and topics not covered by Wikipedia or Arxiv. Input should be a search query."
+    ))
+    
+    return [arxiv_tool, wiki, search]
+
+def planned_queries(tool_map, plan):
+    """Lookups from the plan that target a known tool"""
+    return [q for q in (plan.queries if plan else []) if q.tool in tool_map]
+
+def format_observations(results):
+    """Render tool results as the context block for the answer prompt"""
+    return "\n\n".join(f"[{q.tool}: {q.query}]\n{result}" for q, result in results)
+
+def run_lookups(tool_map, queries, config, timeout=TOOL_TIMEOUT):
+    """Run the lookups concurrently, giving up on any still running after timeout"""
+    if not queries:
+        return []
+
+    def invoke(q):
+        try:
+            return tool_map[q.tool].invoke(q.query, config)
+        except TimeoutError:
+            return TIMEOUT_OBSERVATION
+        except Exception as e:
+            return f"{ERROR_PREFIX}{str(e)}"
+
+    executor = ContextThreadPoolExecutor(max_workers=config.get("max_concurrency"))
+    futures = [executor.submit(invoke, q) for q in queries]
+    wait(futures, timeout=timeout)
+    # Don't block on stragglers; their threads finish in the background
+    executor.shutdown(wait=False)
+    results = [f.result() if f.done() else TIMEOUT_OBSERVATION for f in futures]
+    return list(zip(queries, results))
+
+async def arun_lookups(tool_map, queries, config, timeout=TOOL_TIMEOUT):
+    """Async counterpart of run_lookups, gathering the lookups"""
+    if not queries:
+        return []
+
+    # The tools are blocking; run them on a dedicated pool rather than the
+    # loop's default executor, which asyncio.run joins on exit
+    loop = asyncio.get_running_loop()
+    executor = ContextThreadPoolExecutor(max_workers=len(queries))
+
+    async def ainvoke(q):
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, tool_map[q.tool].invoke, q.query, config),
+                timeout
+            )
+        except (asyncio.TimeoutError, TimeoutError):
+            return TIMEOUT_OBSERVATION
+        except Exception as e:
+            return f"{ERROR_PREFIX}{str(e)}"
+
+    try:
+        results = await asyncio.gather(*[ainvoke(q) for q in queries])
+    finally:
+        # Don't block on stragglers; their threads finish in the background
+        executor.shutdown(wait=False)
+    return list(zip(queries, results))